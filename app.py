@@ -6,79 +6,142 @@ Upload a business card image, extract contact info, and add to Mailchimp
 
 from flask import Flask, render_template, request, jsonify
 import os
-import re
 import hashlib
+from functools import lru_cache
 import requests
-from PIL import Image, ImageEnhance
-import pytesseract
-from werkzeug.utils import secure_filename
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import cv2
+import numpy as np
+from PIL import Image
+from patterns import EMAIL_RE, APP_PHONE_RE, WEB_RE
 import secrets
 
+# Tesseract reads this when it loads: keep it single-threaded and run the
+# rotations side by side instead of letting OpenMP oversubscribe the CPU
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+from tesserocr import PyTessBaseAPI, PSM, OEM
+
 app = Flask(__name__)
 app.config['SECRET_KEY'] = secrets.token_hex(16)
-app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 app.config['ALLOWED_EXTENSIONS'] = {'jpg', 'jpeg', 'png', 'heic'}
 
-# Create uploads directory
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-
 # Mailchimp configuration from environment variables
 MAILCHIMP_API_KEY = os.getenv("MAILCHIMP_API_KEY")
 MAILCHIMP_SERVER_PREFIX = os.getenv("MAILCHIMP_SERVER_PREFIX")
 MAILCHIMP_LIST_ID = os.getenv("MAILCHIMP_LIST_ID")
 MAILCHIMP_TAG = os.getenv("MAILCHIMP_TAG", "Referral Source")
 
-# Regex patterns for extracting contact information
-EMAIL_PATTERN = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b')
-PHONE_PATTERN = re.compile(r'(?:\+?1[\s\-.])?(?:\(?\d{3}\)?[\s\-.]?)?\d{3}[\s\-.]?\d{4}')
-WEBSITE_PATTERN = re.compile(r'(?:https?://)?(?:www\.)?[A-Za-z0-9\-]+(?:\.[A-Za-z]{2,}){1,}(?:/[^\s]*)?')
+# Reuse one keep-alive session for all Mailchimp calls instead of a new TLS handshake each
+_MC = requests.Session()
+_MC.auth = ("anystring", MAILCHIMP_API_KEY)
+_MC.mount("https://", HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=10,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504], raise_on_status=False)
+))
+
+_OCR_POOL = ThreadPoolExecutor(max_workers=os.cpu_count() or 4)
+
+# Tesseract time grows with pixel count; a card is legible well below phone-camera size
+MAX_OCR_EDGE = 2000
+
+# Tesseract API handles are not thread-safe, so each thread keeps its own
+_tess = threading.local()
+
+# OpenCV flags for rotating an image counter-clockwise by the given degrees
+_ROTATIONS = {
+    90: cv2.ROTATE_90_COUNTERCLOCKWISE,
+    180: cv2.ROTATE_180,
+    270: cv2.ROTATE_90_CLOCKWISE,
+}
 
 def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
-def extract_text_from_image(image_path):
-    """Extract text from image using OCR with multiple attempts"""
+def preprocess(image):
+    """Grayscale, normalize contrast, binarize and deskew an image for OCR; returns a numpy array"""
+    if image.mode == 'L':
+        gray = np.asarray(image)
+    elif image.mode in ('RGB', 'RGBA'):
+        code = cv2.COLOR_RGB2GRAY if image.mode == 'RGB' else cv2.COLOR_RGBA2GRAY
+        gray = cv2.cvtColor(np.asarray(image), code)
+    else:
+        gray = np.asarray(image.convert('L'))
+    gray = cv2.createCLAHE(clipLimit=2.0).apply(gray)
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    
+    # Deskew using the minimum-area rectangle around the dark (text) pixels
+    coords = cv2.findNonZero(255 - binary)
+    if coords is not None:
+        angle = cv2.minAreaRect(coords)[-1]
+        if angle > 45:
+            angle -= 90
+        elif angle < -45:
+            angle += 90
+        if abs(angle) > 0.5:
+            height, width = binary.shape
+            matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+            binary = cv2.warpAffine(binary, matrix, (width, height),
+                                    flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
+    
+    return binary
+
+def _tess_api():
+    """Return this thread's Tesseract API, loading the language model only once"""
+    api = getattr(_tess, 'api', None)
+    if api is None:
+        # Preprocessed cards are a single uniform block of text; use the LSTM engine
+        api = _tess.api = PyTessBaseAPI(psm=PSM.SINGLE_BLOCK, oem=OEM.LSTM_ONLY)
+    return api
+
+def _ocr_one(image):
+    """Run Tesseract on one image; return the text and whether it has an email / phone"""
+    api = _tess_api()
+    api.SetImage(Image.fromarray(image))
+    text = api.GetUTF8Text()
+    return text, EMAIL_RE.search(text) is not None, APP_PHONE_RE.search(text) is not None
+
+def extract_text_from_image(image_file):
+    """Extract text from an image path or file object using a single preprocessed OCR pass"""
     try:
-        # Open and process image
-        image = Image.open(image_path)
+        image = Image.open(image_file)
+        image.thumbnail((MAX_OCR_EDGE, MAX_OCR_EDGE), Image.Resampling.LANCZOS)
+        image = preprocess(image)
         
-        # Convert to RGB if needed
-        if image.mode not in ("RGB", "L"):
-            image = image.convert("RGB")
+        best_text, has_email, has_phone = _ocr_one(image)
+        if has_email or has_phone:
+            return best_text
+        best_score = best_text.count('\n')
         
-        # Convert to grayscale for better OCR
-        gray_image = image.convert('L')
-        
-        # Try different image enhancements
-        variations = [
-            ("Original", gray_image),
-            ("High Contrast", ImageEnhance.Contrast(gray_image).enhance(2.0)),
-            ("Sharpened", ImageEnhance.Sharpness(gray_image).enhance(2.0)),
-            ("Brightened", ImageEnhance.Brightness(gray_image).enhance(1.2)),
-        ]
-        
-        best_text = ""
-        best_score = 0
+        # No contact info found - the card may be sideways or upside down
+        futures = {
+            _OCR_POOL.submit(_ocr_one, cv2.rotate(image, _ROTATIONS[angle])): f"Rotated {angle}°"
+            for angle in (90, 180, 270)
+        }
         
-        for name, processed_image in variations:
+        for future in as_completed(futures):
             try:
-                # Extract text using Tesseract
-                text = pytesseract.image_to_string(processed_image, config='--psm 3')
-                
-                # Score based on found contact info
-                emails = EMAIL_PATTERN.findall(text)
-                phones = PHONE_PATTERN.findall(text)
-                score = len(emails) * 10 + len(phones) * 5 + len(text.split())
-                
-                if score > best_score:
-                    best_score = score
-                    best_text = text
-                    
+                text, has_email, has_phone = future.result()
             except Exception as e:
-                print(f"OCR failed for {name}: {e}")
+                print(f"OCR failed for {futures[future]}: {e}")
                 continue
+            
+            # Both an email and a phone: this is the right way up, stop looking
+            if has_email and has_phone:
+                for other in futures:
+                    other.cancel()
+                return text
+            
+            # Score based on found contact info, then amount of text
+            score = has_email * 10 + has_phone * 5 + text.count('\n')
+            if score > best_score:
+                best_score = score
+                best_text = text
         
         return best_text
         
@@ -93,34 +156,28 @@ def parse_contact_info(text):
     
     lines = [line.strip() for line in text.split('\n') if line.strip()]
     
-    # Extract email, phone, website
-    email_match = EMAIL_PATTERN.search(text)
-    phone_match = PHONE_PATTERN.search(text)
-    website_match = WEBSITE_PATTERN.search(text)
-    
-    email = email_match.group(0) if email_match else None
-    phone = phone_match.group(0) if phone_match else None
-    website = website_match.group(0) if website_match else None
-    
-    # Extract name and company from lines
-    name = None
-    company = None
-    
-    # Look for name and company in first few lines
-    for i, line in enumerate(lines[:5]):
-        # Skip lines that contain email, phone, or website
-        if EMAIL_PATTERN.search(line) or PHONE_PATTERN.search(line) or WEBSITE_PATTERN.search(line):
-            continue
+    # One pass over the lines: the first hit of each kind wins, and lines near
+    # the top with no contact details are the name and company candidates
+    email = phone = website = None
+    name = company = None
+    for i, line in enumerate(lines):
+        top = i < 5
+        if not top and email and phone and website:
+            break
+        email_match = EMAIL_RE.search(line) if top or not email else None
+        phone_match = APP_PHONE_RE.search(line) if top or not phone else None
+        website_match = WEB_RE.search(line) if top or not website else None
+        email = email or (email_match.group(0) if email_match else None)
+        phone = phone or (phone_match.group(0) if phone_match else None)
+        website = website or (website_match.group(0) if website_match else None)
         
-        # Skip very short lines
-        if len(line.split()) < 2:
+        # Skip lines that contain email, phone, or website, and very short lines
+        if not top or email_match or phone_match or website_match or len(line.split()) < 2:
             continue
-            
         if not name:
             name = line
-        elif not company and len(line.split()) > 1:
+        elif not company:
             company = line
-            break
     
     return {
         'name': name,
@@ -130,6 +187,11 @@ def parse_contact_info(text):
         'website': website
     }
 
+@lru_cache(maxsize=4096)
+def _sub_hash(email_lower):
+    """Mailchimp subscriber hash: MD5 of the lowercased email"""
+    return hashlib.md5(email_lower.encode()).hexdigest()
+
 def add_to_mailchimp(email, first_name, last_name, company, phone, website):
     """Add contact to Mailchimp list"""
     if not email:
@@ -138,8 +200,10 @@ def add_to_mailchimp(email, first_name, last_name, company, phone, website):
     if not all([MAILCHIMP_API_KEY, MAILCHIMP_SERVER_PREFIX, MAILCHIMP_LIST_ID]):
         return False, "Mailchimp configuration missing"
     
+    email = email.lower()
+    
     # Create subscriber hash
-    subscriber_hash = hashlib.md5(email.lower().encode()).hexdigest()
+    subscriber_hash = _sub_hash(email)
     
     # Mailchimp API endpoint
     base_url = f"https://{MAILCHIMP_SERVER_PREFIX}.api.mailchimp.com/3.0"
@@ -147,7 +211,7 @@ def add_to_mailchimp(email, first_name, last_name, company, phone, website):
     
     # Prepare payload
     payload = {
-        "email_address": email.lower(),
+        "email_address": email,
         "status_if_new": "subscribed",
         "status": "subscribed",
         "merge_fields": {
@@ -161,9 +225,8 @@ def add_to_mailchimp(email, first_name, last_name, company, phone, website):
     
     try:
         # Add/update subscriber
-        response = requests.put(
+        response = _MC.put(
             url,
-            auth=("anystring", MAILCHIMP_API_KEY),
             json=payload,
             timeout=30
         )
@@ -173,9 +236,8 @@ def add_to_mailchimp(email, first_name, last_name, company, phone, website):
             if MAILCHIMP_TAG:
                 try:
                     tag_url = f"{base_url}/lists/{MAILCHIMP_LIST_ID}/members/{subscriber_hash}/tags"
-                    requests.post(
+                    _MC.post(
                         tag_url,
-                        auth=("anystring", MAILCHIMP_API_KEY),
                         json={"tags": [{"name": MAILCHIMP_TAG, "status": "active"}]},
                         timeout=20
                     )
@@ -215,69 +277,58 @@ def upload_file():
         if not allowed_file(file.filename):
             return jsonify({'success': False, 'error': 'Invalid file type. Please upload JPG, PNG, or HEIC'}), 400
         
-        # Save uploaded file
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        # Extract text straight from the upload stream; nothing touches disk
+        text = extract_text_from_image(file.stream)
         
-        try:
-            # Extract text from image
-            text = extract_text_from_image(filepath)
-            
-            if not text.strip():
-                return jsonify({
-                    'success': False,
-                    'error': 'Could not extract text from image. Please ensure the image is clear and well-lit.'
-                }), 400
-            
-            # Parse contact information
-            contact = parse_contact_info(text)
-            
-            if not contact.get('email'):
-                return jsonify({
-                    'success': False,
-                    'error': 'No email address found on business card',
-                    'contact': contact
-                }), 400
-            
-            # Split name into first and last
-            first_name = ""
-            last_name = ""
-            if contact.get('name'):
-                name_parts = contact['name'].split()
-                if len(name_parts) >= 2:
-                    first_name = name_parts[0]
-                    last_name = " ".join(name_parts[1:])
-                else:
-                    first_name = name_parts[0]
-            
-            # Add to Mailchimp
-            success, message = add_to_mailchimp(
-                contact['email'],
-                first_name,
-                last_name,
-                contact.get('company'),
-                contact.get('phone'),
-                contact.get('website')
-            )
-            
-            if success:
-                return jsonify({
-                    'success': True,
-                    'message': f"Successfully added {contact['email']} to Mailchimp!",
-                    'contact': contact
-                })
+        if not text.strip():
+            return jsonify({
+                'success': False,
+                'error': 'Could not extract text from image. Please ensure the image is clear and well-lit.'
+            }), 400
+        
+        # Parse contact information
+        contact = parse_contact_info(text)
+        
+        if not contact.get('email'):
+            return jsonify({
+                'success': False,
+                'error': 'No email address found on business card',
+                'contact': contact
+            }), 400
+        
+        # Split name into first and last
+        first_name = ""
+        last_name = ""
+        if contact.get('name'):
+            name_parts = contact['name'].split()
+            if len(name_parts) >= 2:
+                first_name = name_parts[0]
+                last_name = " ".join(name_parts[1:])
             else:
-                return jsonify({
-                    'success': False,
-                    'error': f"Failed to add to Mailchimp: {message}",
-                    'contact': contact
-                }), 500
-                
-        finally:
-            # Clean up uploaded file
-            if os.path.exists(filepath):
-                os.remove(filepath)
+                first_name = name_parts[0]
+        
+        # Add to Mailchimp
+        success, message = add_to_mailchimp(
+            contact['email'],
+            first_name,
+            last_name,
+            contact.get('company'),
+            contact.get('phone'),
+            contact.get('website')
+        )
+        
+        if success:
+            return jsonify({
+                'success': True,
+                'message': f"Successfully added {contact['email']} to Mailchimp!",
+                'contact': contact
+            })
+        else:
+            return jsonify({
+                'success': False,
+                'error': f"Failed to add to Mailchimp: {message}",
+                'contact': contact
+            }), 500
                 
     except Exception as e:
         return jsonify({
@@ -1,21 +1,32 @@
 #!/usr/bin/env python3
-import os, io, re, hashlib, logging
-from typing import Dict, List, Optional, Tuple
+import os, io, json, time, shelve, tarfile, hashlib, logging, threading
+import multiprocessing
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Set, Tuple
 
 from dotenv import load_dotenv
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseDownload
 
-from PIL import Image, ImageEnhance
+import cv2
+import numpy as np
+from PIL import Image
 from pillow_heif import register_heif_opener
 register_heif_opener()
-import pytesseract
+# Keep Tesseract single-threaded; must be set before the library loads
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+from tesserocr import PyTessBaseAPI, PSM, OEM
 from pdf2image import convert_from_bytes
 
+from patterns import EMAIL_RE, PHONE_RE, WEB_RE
+
 load_dotenv()
 logging.basicConfig(
     level=getattr(logging, os.getenv("LOG_LEVEL","INFO").upper()),
@@ -30,12 +41,42 @@ MAILCHIMP_SERVER_PREFIX = os.getenv("MAILCHIMP_SERVER_PREFIX")
 MAILCHIMP_LIST_ID = os.getenv("MAILCHIMP_LIST_ID")
 MAILCHIMP_TAG = os.getenv("MAILCHIMP_TAG","Referral Source")
 GOOGLE_OAUTH_CLIENT_JSON = os.getenv("GOOGLE_OAUTH_CLIENT_JSON","client_secret.json")
+# Remembers the newest Drive modifiedTime already processed, so reruns only list new cards
+STATE_PATH = os.getenv("STATE_PATH","state.json")
+# Drive files already sent to Mailchimp, keyed by "<fileId>:<modifiedTime>"
+PROCESSED_DB = os.getenv("PROCESSED_DB","processed.db")
+# Mailchimp allows 10 simultaneous connections per API key
+MAILCHIMP_MAX_CONNECTIONS = 10
+MAILCHIMP_BATCH_SIZE = 500
+# Give up on a batch Mailchimp hasn't finished after this many seconds
+MAILCHIMP_BATCH_TIMEOUT = 15 * 60
+DRIVE_DOWNLOAD_WORKERS = 8
+# Tesseract time grows with pixel count; a card is legible well below phone-camera size
+MAX_OCR_EDGE = 2000
+# OSD confidence below which a card is left unrotated; on sparse cards OSD often guesses wrong
+MIN_OSD_CONFIDENCE = 2.0
+
+# Keep-alive session shared by all Mailchimp calls
+_MC = requests.Session()
+_MC.auth = ("anystring", MAILCHIMP_API_KEY)
+_MC.mount("https://", HTTPAdapter(
+    pool_connections=MAILCHIMP_MAX_CONNECTIONS,
+    pool_maxsize=MAILCHIMP_MAX_CONNECTIONS,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429,500,502,503,504], raise_on_status=False),
+))
+
+# Lowercased emails Mailchimp has already accepted during this run
+_SEEN_EMAILS: Set[str] = set()
 
-EMAIL_RE = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}", re.I)
-PHONE_RE = re.compile(r"(?:(?:\+?1[\s\-.])?)?(?:\(?\d{3}\)?|\d{3})[\s\-.]?\d{3}[\s\-.]?\d{4}")
-WEB_RE = re.compile(r"\b(?:https?://)?(?:www\.)?[A-Za-z0-9\-]+(?:\.[A-Za-z]{2,}){1,}(/[^\s]*)?\b")
+# Tesseract API handles are loaded once and reused, but are not thread-safe
+_tess = threading.local()
+# Neither is googleapiclient's httplib2 transport: one Drive service per thread
+_drive = threading.local()
 
-def drive_service():
+# OpenCV flags that undo a clockwise rotation of the given degrees
+_UNROTATE = {90: cv2.ROTATE_90_COUNTERCLOCKWISE, 180: cv2.ROTATE_180, 270: cv2.ROTATE_90_CLOCKWISE}
+
+def drive_credentials() -> Credentials:
     creds = None
     token_path = "token.json"
     if os.path.exists(token_path):
@@ -52,12 +93,39 @@ def drive_service():
             creds = flow.run_local_server(port=0)
         with open(token_path, "w") as f:
             f.write(creds.to_json())
-    return build("drive","v3",credentials=creds)
+    return creds
+
+def drive_service(creds: Optional[Credentials] = None):
+    return build("drive","v3",credentials=creds or drive_credentials(), cache_discovery=False)
+
+def _thread_drive_service(creds: Credentials):
+    svc = getattr(_drive, "svc", None)
+    if svc is None:
+        svc = _drive.svc = drive_service(creds)
+    return svc
+
+def load_state() -> Dict:
+    if not os.path.exists(STATE_PATH):
+        return {}
+    with open(STATE_PATH) as f:
+        return json.load(f)
+
+def save_state(state: Dict):
+    with open(STATE_PATH, "w") as f:
+        json.dump(state, f)
+
+def _processed_key(f: Dict) -> str:
+    return f"{f['id']}:{f['modifiedTime']}"
 
-def list_files(svc, folder_id: str):
+def list_files(svc, folder_id: str, modified_after: Optional[str] = None):
     q = f"'{folder_id}' in parents and (mimeType contains 'image/' or mimeType = 'application/pdf') and trashed = false"
-    res = svc.files().list(q=q, fields="files(id,name,mimeType,modifiedTime)").execute()
-    return res.get("files", [])
+    if modified_after:
+        q += f" and modifiedTime > '{modified_after}'"
+    req = svc.files().list(q=q, pageSize=1000, fields="nextPageToken,files(id,name,mimeType,modifiedTime)")
+    while req is not None:
+        res = req.execute()
+        yield from res.get("files", [])
+        req = svc.files().list_next(req, res)
 
 def download(svc, fid: str) -> bytes:
     req = svc.files().get_media(fileId=fid)
@@ -68,47 +136,79 @@ def download(svc, fid: str) -> bytes:
         status, done = downloader.next_chunk()
     return buf.getvalue()
 
+def _thread_download(creds: Credentials, fid: str) -> bytes:
+    return download(_thread_drive_service(creds), fid)
+
+def preprocess(img: Image.Image) -> np.ndarray:
+    if img.mode == "L":
+        gray = np.asarray(img)
+    elif img.mode in ("RGB", "RGBA"):
+        gray = cv2.cvtColor(np.asarray(img), cv2.COLOR_RGB2GRAY if img.mode == "RGB" else cv2.COLOR_RGBA2GRAY)
+    else:
+        gray = np.asarray(img.convert("L"))
+    gray = cv2.createCLAHE(clipLimit=2.0).apply(gray)
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+
+    # Deskew using the minimum-area rectangle around the dark (text) pixels
+    coords = cv2.findNonZero(255 - binary)
+    if coords is not None:
+        angle = cv2.minAreaRect(coords)[-1]
+        if angle > 45:
+            angle -= 90
+        elif angle < -45:
+            angle += 90
+        if abs(angle) > 0.5:
+            h, w = binary.shape
+            m = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+            binary = cv2.warpAffine(binary, m, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
+
+    return binary
+
+def _tess_api(name: str, **kwargs) -> PyTessBaseAPI:
+    api = getattr(_tess, name, None)
+    if api is None:
+        api = PyTessBaseAPI(**kwargs)
+        setattr(_tess, name, api)
+    return api
+
+# Clockwise rotation (0/90/180/270) of the image, via Tesseract OSD
+def detect_rotation(img: Image.Image) -> int:
+    api = _tess_api("osd", psm=PSM.OSD_ONLY)
+    api.SetImage(img)
+    osd = api.DetectOrientationScript()
+    if not osd:
+        # OSD needs a minimum amount of text; assume the card is upright
+        log.debug("Orientation detection failed")
+        return 0
+    if osd["orient_conf"] < MIN_OSD_CONFIDENCE:
+        log.debug("Ignoring low-confidence orientation %d° (%.2f)", osd["orient_deg"], osd["orient_conf"])
+        return 0
+    return osd["orient_deg"]
+
 def ocr_bytes_with_rotation(data: bytes, mime: str) -> str:
     try:
         if mime == "application/pdf":
-            pages = convert_from_bytes(data, dpi=300)
+            # Only the first page is OCR'd, so don't render the rest
+            pages = convert_from_bytes(data, dpi=200, first_page=1, last_page=1, use_pdftocairo=True)
             if not pages:
                 return ""
             original_image = pages[0]
         else:
             original_image = Image.open(io.BytesIO(data))
+        original_image.thumbnail((MAX_OCR_EDGE, MAX_OCR_EDGE), Image.Resampling.LANCZOS)
         
-        if original_image.mode not in ("RGB", "L"):
-            original_image = original_image.convert("RGB")
-        
-        gray_image = original_image.convert('L')
-        
-        variations = [
-            ("Original", gray_image),
-            ("High Contrast", ImageEnhance.Contrast(gray_image).enhance(2.0)),
-            ("Rotated 90°", gray_image.rotate(90, expand=True)),
-            ("Rotated 180°", gray_image.rotate(180, expand=True)),
-            ("Rotated 270°", gray_image.rotate(270, expand=True)),
-        ]
+        binary = preprocess(original_image)
+        image = Image.fromarray(binary)
         
-        best_result = ""
-        best_score = 0
+        rotation = detect_rotation(image)
+        if rotation:
+            log.info("Rotating image %d° to upright", rotation)
+            image = Image.fromarray(cv2.rotate(binary, _UNROTATE[rotation]))
         
-        for name, img in variations:
-            try:
-                text = pytesseract.image_to_string(img, config="--psm 3")
-                emails = EMAIL_RE.findall(text)
-                phones = PHONE_RE.findall(text)
-                score = len(emails) * 10 + len(phones) * 5 + len(text.split())
-                
-                if score > best_score:
-                    best_score = score
-                    best_result = text
-                    log.info(f"New best OCR result from {name} (score: {score})")
-            except Exception:
-                continue
-        
-        return best_result
+        # Preprocessed cards are a single uniform block of text; use the LSTM engine
+        api = _tess_api("ocr", psm=PSM.SINGLE_BLOCK, oem=OEM.LSTM_ONLY)
+        api.SetImage(image)
+        return api.GetUTF8Text()
     except Exception as e:
         log.error("OCR processing failed: %s", e)
         return ""
@@ -116,22 +216,26 @@ def ocr_bytes_with_rotation(data: bytes, mime: str) -> str:
 def parse(text: str) -> Dict[str, Optional[str]]:
     lines = [l.strip() for l in text.splitlines() if l.strip()]
     block = "\n".join(lines)
-    email = EMAIL_RE.search(block)
-    phone = PHONE_RE.search(block)
-    web = WEB_RE.search(block)
 
-    name = company = None
+    # Single pass: keep the first email/phone/website hit, and take lines in the
+    # top six with none of them as name/company candidates
+    email = phone = web = None
     candidates = []
-    for ln in lines[:6]:
-        if EMAIL_RE.search(ln) or PHONE_RE.search(ln) or WEB_RE.search(ln):
-            continue
-        if len(ln.split()) <= 1:
-            continue
-        candidates.append(ln)
-    if candidates:
-        name = candidates[0]
-        if len(candidates) > 1:
-            company = candidates[1]
+    for i, ln in enumerate(lines):
+        top = i < 6
+        if not top and email and phone and web:
+            break
+        e = EMAIL_RE.search(ln) if top or not email else None
+        p = PHONE_RE.search(ln) if top or not phone else None
+        w = WEB_RE.search(ln) if top or not web else None
+        email = email or e
+        phone = phone or p
+        web = web or w
+        if top and not (e or p or w) and len(ln.split()) > 1:
+            candidates.append(ln)
+
+    name = candidates[0] if candidates else None
+    company = candidates[1] if len(candidates) > 1 else None
 
     return {
         "name": name,
@@ -142,92 +246,271 @@ def parse(text: str) -> Dict[str, Optional[str]]:
         "raw_text": block
     }
 
+@lru_cache(maxsize=4096)
+def _sub_hash(email_lower: str) -> str:
+    return hashlib.md5(email_lower.encode()).hexdigest()
+
+def _member_payload(email_lower: str, merge: Dict[str,str]) -> Dict:
+    return {
+        "email_address": email_lower,
+        "status_if_new": "subscribed",
+        "status": "subscribed",
+        "merge_fields": merge
+    }
+
 def mc_upsert(email: str, merge: Dict[str,str], tags: List[str]) -> Tuple[bool, Dict]:
     if not email:
         return False, {"error":"missing email"}
-    mhash = hashlib.md5(email.lower().encode()).hexdigest()
+    low = email.lower()
+    if low in _SEEN_EMAILS:
+        return True, {"email_address": low, "skipped": "already upserted"}
+    mhash = _sub_hash(low)
     base = f"https://{MAILCHIMP_SERVER_PREFIX}.api.mailchimp.com/3.0"
     url = f"{base}/lists/{MAILCHIMP_LIST_ID}/members/{mhash}"
-    auth = ("anystring", MAILCHIMP_API_KEY)
-    payload = {
-        "email_address": email.lower(),
-        "status_if_new": "subscribed",
-        "status": "subscribed",
-        "merge_fields": merge
-    }
-    r = requests.put(url, auth=auth, json=payload, timeout=30)
+    r = _MC.put(url, json=_member_payload(low, merge), timeout=30)
     ok = r.status_code in (200,201)
+    if ok:
+        _SEEN_EMAILS.add(low)
     try:
         data = r.json()
     except Exception:
         data = {"status_code": r.status_code, "text": r.text}
     if ok and tags:
         try:
-            requests.post(f"{base}/lists/{MAILCHIMP_LIST_ID}/members/{mhash}/tags",
-                          auth=auth, json={"tags":[{"name":t,"status":"active"} for t in tags]}, timeout=20)
+            _MC.post(f"{base}/lists/{MAILCHIMP_LIST_ID}/members/{mhash}/tags",
+                     json={"tags":[{"name":t,"status":"active"} for t in tags]}, timeout=20)
         except Exception:
             pass
     return ok, data
 
+# Submit operations to Mailchimp's /batches endpoint and (unless wait is False) poll
+# until they have run; raises requests.Timeout after MAILCHIMP_BATCH_TIMEOUT
+def mc_run_batch(operations: List[Dict], wait: bool = True) -> Dict:
+    base = f"https://{MAILCHIMP_SERVER_PREFIX}.api.mailchimp.com/3.0"
+    r = _MC.post(f"{base}/batches", json={"operations": operations}, timeout=30)
+    r.raise_for_status()
+    batch = r.json()
+    deadline = time.monotonic() + MAILCHIMP_BATCH_TIMEOUT
+    delay = 1.0
+    while wait and batch.get("status") != "finished":
+        if time.monotonic() + delay > deadline:
+            raise requests.Timeout(f"Mailchimp batch {batch['id']} still {batch.get('status')} "
+                                   f"after {MAILCHIMP_BATCH_TIMEOUT}s")
+        time.sleep(delay)
+        delay = min(delay * 2, 30)
+        r = _MC.get(f"{base}/batches/{batch['id']}", timeout=30)
+        r.raise_for_status()
+        batch = r.json()
+    return batch
+
+# Mailchimp rejects a bad address with a 4xx that no retry will fix; anything else
+# (5xx, 429, no response at all) is worth trying again on the next run
+def mc_retryable(status) -> bool:
+    return not isinstance(status, int) or status == 429 or status >= 500
+
+# operation_id -> HTTP status of each operation that failed in a finished batch, read
+# from the gzipped tar of JSON results Mailchimp leaves at response_body_url
+def mc_batch_failures(batch: Dict) -> Dict[str, int]:
+    # A presigned S3 link; the Mailchimp session's auth header would be rejected there
+    r = requests.get(batch["response_body_url"], timeout=60)
+    r.raise_for_status()
+    failures = {}
+    with tarfile.open(fileobj=io.BytesIO(r.content), mode="r:gz") as tar:
+        for member in tar:
+            if not member.isfile() or not member.name.endswith(".json"):
+                continue
+            for result in json.load(tar.extractfile(member)):
+                if result.get("status_code") not in (200, 201):
+                    failures[result.get("operation_id")] = result.get("status_code")
+    return failures
+
+# Upsert many contacts with one batch call per MAILCHIMP_BATCH_SIZE instead of a
+# PUT each. Returns (succeeded, errored) operation counts and the lowercased emails
+# whose upsert failed in a way worth retrying.
+def mc_batch_upsert(contacts: List[Tuple[str, Dict[str,str]]], tags: List[str]) -> Tuple[int, int, Set[str]]:
+    members = f"/lists/{MAILCHIMP_LIST_ID}/members"
+    tag_body = json.dumps({"tags":[{"name":t,"status":"active"} for t in tags]})
+    # Drop repeats of the same address (within the batch or already upserted)
+    pending: Dict[str, Dict[str,str]] = {}
+    for email, merge in contacts:
+        low = email.lower()
+        if low not in _SEEN_EMAILS:
+            pending.setdefault(low, merge)
+    unique = list(pending.items())
+    # Hash every address in one pass before building the operations
+    hashes = [hashlib.md5(low.encode()).hexdigest() for low in pending]
+    succeeded = errored = 0
+    retry = set()
+    for i in range(0, len(unique), MAILCHIMP_BATCH_SIZE):
+        chunk = unique[i:i + MAILCHIMP_BATCH_SIZE]
+        upserts, tag_ops = [], []
+        for (low, merge), mhash in zip(chunk, hashes[i:i + MAILCHIMP_BATCH_SIZE]):
+            upserts.append({"method": "PUT", "path": f"{members}/{mhash}", "operation_id": low,
+                            "body": json.dumps(_member_payload(low, merge))})
+            if tags:
+                tag_ops.append({"method": "POST", "path": f"{members}/{mhash}/tags", "body": tag_body})
+        batch = mc_run_batch(upserts)
+        log.info("Mailchimp batch %s: %d/%d operations errored",
+                 batch["id"], batch.get("errored_operations", 0), batch.get("total_operations", 0))
+        errored += batch.get("errored_operations", 0)
+        succeeded += batch.get("total_operations", 0) - batch.get("errored_operations", 0)
+        failures = {}
+        if batch.get("errored_operations"):
+            try:
+                failures = mc_batch_failures(batch)
+            except (requests.RequestException, tarfile.TarError, ValueError) as e:
+                # Without per-operation results there's no telling which ones failed,
+                # so all of them are retried
+                log.error("Reading results of Mailchimp batch %s failed: %s", batch["id"], e)
+                failures = dict.fromkeys(low for low, _ in chunk)
+        for low, _ in chunk:
+            if low not in failures:
+                _SEEN_EMAILS.add(low)
+            elif mc_retryable(failures[low]):
+                retry.add(low)
+            else:
+                log.warning("Mailchimp rejected %s (HTTP %s)", low, failures[low])
+        if tag_ops:
+            # Members must exist before they can be tagged, so tags go in a second batch;
+            # nothing depends on its result, so don't wait for it
+            mc_run_batch(tag_ops, wait=False)
+    return succeeded, errored, retry
+
+# Parse one file's OCR text into the (email, merge fields) to send to Mailchimp,
+# or None when the file should be skipped.
+def contact_from_text(name: str, text: str) -> Optional[Tuple[str, Dict[str,str]]]:
+    if not text.strip():
+        log.warning("No text extracted from %s", name)
+        return None
+        
+    fields = parse(text)
+    log.info("Parsed: name='%s', email='%s', phone='%s', company='%s'", 
+             fields.get("name"), fields.get("email"), fields.get("phone"), fields.get("company"))
+    
+    email = fields.get("email")
+    if not email:
+        log.warning("No email found for %s - skipping Mailchimp", name)
+        return None
+        
+    fname = lname = None
+    if fields.get("name"):
+        parts = fields["name"].split()
+        if len(parts) >= 2:
+            fname, lname = parts[0], " ".join(parts[1:])
+        else:
+            fname = parts[0]
+            
+    merge = {
+        "FNAME": fname or "",
+        "LNAME": lname or "",
+        "COMPANY": fields.get("company") or "",
+        "PHONE": fields.get("phone") or "",
+        "WEBSITE": fields.get("website") or "",
+    }
+    return email, merge
+
 def main():
     for env in ["DRIVE_FOLDER_ID","MAILCHIMP_API_KEY","MAILCHIMP_SERVER_PREFIX","MAILCHIMP_LIST_ID"]:
         if not os.getenv(env):
             log.error("Missing %s in .env", env)
             return
-    svc = drive_service()
-    files = list_files(svc, DRIVE_FOLDER_ID)
+    creds = drive_credentials()
+    state = load_state()
+    files = list(list_files(drive_service(creds), DRIVE_FOLDER_ID, state.get("last_modified")))
     if not files:
-        log.info("No files found in Drive folder.")
+        log.info("No new files found in Drive folder.")
         return
     
     jpg_files = [f for f in files if f["mimeType"] == "image/jpeg"]
+    with shelve.open(PROCESSED_DB) as db:
+        todo = [f for f in jpg_files if _processed_key(f) not in db]
+    if len(todo) < len(jpg_files):
+        log.info("Skipping %d JPG files already processed", len(jpg_files) - len(todo))
+    jpg_files = todo
     log.info("Found %d JPG files to process", len(jpg_files))
 
-    processed = 0
-    successful_contacts = 0
+    contacts = []
+    contact_files = []
+    failed = []
 
-    for f in jpg_files:
-        fid, name, mime = f["id"], f["name"], f["mimeType"]
-        log.info("Processing %s (%s)", name, mime)
-        data = download(svc, fid)
-        text = ocr_bytes_with_rotation(data, mime)
-        if not text.strip():
-            log.warning("No text extracted from %s", name)
-            continue
-            
-        fields = parse(text)
-        log.info("Parsed: name='%s', email='%s', phone='%s', company='%s'", 
-                 fields.get("name"), fields.get("email"), fields.get("phone"), fields.get("company"))
-        
-        email = fields.get("email")
-        if not email:
-            log.warning("No email found for %s - skipping Mailchimp", name)
-            continue
-            
-        fname = lname = None
-        if fields.get("name"):
-            parts = fields["name"].split()
-            if len(parts) >= 2:
-                fname, lname = parts[0], " ".join(parts[1:])
-            else:
-                fname = parts[0]
-                
-        merge = {
-            "FNAME": fname or "",
-            "LNAME": lname or "",
-            "COMPANY": fields.get("company") or "",
-            "PHONE": fields.get("phone") or "",
-            "WEBSITE": fields.get("website") or "",
-        }
-        
-        ok, resp = mc_upsert(email, merge, [MAILCHIMP_TAG] if MAILCHIMP_TAG else [])
+    # Drive downloads run on threads and each finished download goes straight to OCR,
+    # which is CPU-bound and runs in worker processes. Workers are spawned rather than
+    # forked because the download threads are already running.
+    with ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn")) as ocr_pool, \
+            ThreadPoolExecutor(max_workers=DRIVE_DOWNLOAD_WORKERS) as download_pool:
+        downloads = {download_pool.submit(_thread_download, creds, f["id"]): f for f in jpg_files}
+        ocr_jobs = {}
+        for fut in as_completed(downloads):
+            f = downloads[fut]
+            try:
+                data = fut.result()
+            except Exception as e:
+                log.error("Downloading %s failed: %s", f["name"], e)
+                failed.append(f)
+                continue
+            log.info("Processing %s (%s)", f["name"], f["mimeType"])
+            ocr_jobs[ocr_pool.submit(ocr_bytes_with_rotation, data, f["mimeType"])] = f
+
+        for fut in as_completed(ocr_jobs):
+            f = ocr_jobs[fut]
+            try:
+                text = fut.result()
+            except Exception as e:
+                log.error("OCR of %s failed: %s", f["name"], e)
+                failed.append(f)
+                continue
+            contact = contact_from_text(f["name"], text)
+            if contact:
+                contacts.append(contact)
+                contact_files.append(f)
+
+    processed = len(contacts)
+    successful_contacts = 0
+    tags = [MAILCHIMP_TAG] if MAILCHIMP_TAG else []
+    # Lowercased emails whose upsert failed in a way worth retrying, and whether
+    # Mailchimp couldn't be reached at all
+    retry: Set[str] = set()
+    mailchimp_down = False
+    if len(contacts) == 1:
+        email, merge = contacts[0]
+        try:
+            ok, resp = mc_upsert(email, merge, tags)
+        except requests.RequestException as e:
+            ok, resp = False, {"error": str(e)}
         if not ok:
             log.error("Mailchimp upsert failed for %s: %s", email, resp)
+            if mc_retryable(resp.get("status", resp.get("status_code"))):
+                retry.add(email.lower())
         else:
-            log.info("✅ Successfully added %s (%s) to Mailchimp", fname or "Unknown", email)
-            successful_contacts += 1
-        
-        processed += 1
+            log.info("✅ Successfully added %s to Mailchimp", email)
+            successful_contacts = 1
+    elif contacts:
+        try:
+            successful_contacts, _, retry = mc_batch_upsert(contacts, tags)
+        except requests.RequestException as e:
+            log.error("Mailchimp batch upsert failed: %s", e)
+            mailchimp_down = True
+
+    # Remember which files made it into Mailchimp, or were rejected by it for good, so
+    # reruns skip them entirely; the rest count as failed and are retried
+    with shelve.open(PROCESSED_DB) as db:
+        for f, (email, _) in zip(contact_files, contacts):
+            low = email.lower()
+            if low in _SEEN_EMAILS:
+                db[_processed_key(f)] = {"email": email, "ts": time.time()}
+            elif mailchimp_down or low in retry:
+                failed.append(f)
+            else:
+                db[_processed_key(f)] = {"email": email, "ts": time.time(), "rejected": True}
+
+    # Advance the watermark, but not past a file that failed, so it is picked up again
+    done = files
+    if failed:
+        cutoff = min(f["modifiedTime"] for f in failed)
+        done = [f for f in files if f["modifiedTime"] < cutoff]
+    if done:
+        state["last_modified"] = max(f["modifiedTime"] for f in done)
+        save_state(state)
         
     log.info("Processing complete: %d files processed, %d contacts successfully added to Mailchimp", 
              processed, successful_contacts)
@@ -1,11 +1,14 @@
 #!/usr/bin/env python3
 import os
 import io
-import subprocess
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
 from dotenv import load_dotenv
+from PIL import Image
+from pillow_heif import register_heif_opener
+
+register_heif_opener()
 
 load_dotenv()
 
@@ -34,38 +37,28 @@ def convert_heic_files():
         while not done:
             status, done = downloader.next_chunk()
         
-        # Save temporarily
-        heic_filename = f"/tmp/{file['name']}"
-        jpeg_filename = f"/tmp/{file['name'].replace('.HEIC', '.jpg')}"
-        
-        with open(heic_filename, 'wb') as f:
-            f.write(heic_data.getvalue())
-        
-        # Convert using ImageMagick
+        # Convert in memory
         try:
-            subprocess.run(['convert', heic_filename, jpeg_filename], check=True)
+            heic_data.seek(0)
+            image = Image.open(heic_data)
+            jpeg_data = io.BytesIO()
+            image.convert("RGB").save(jpeg_data, "JPEG", quality=90)
+            jpeg_data.seek(0)
             print(f"✅ Converted {file['name']} to JPEG")
-            
-            # Upload JPEG to Google Drive
-            with open(jpeg_filename, 'rb') as f:
-                media = MediaIoBaseUpload(f, mimetype='image/jpeg')
-                jpeg_name = file['name'].replace('.HEIC', '.jpg')
-                
-                new_file = service.files().create(
-                    body={'name': jpeg_name, 'parents': [folder_id]},
-                    media_body=media
-                ).execute()
-                
-                print(f"✅ Uploaded {jpeg_name} to Google Drive")
-                
-        except subprocess.CalledProcessError:
+        except (OSError, ValueError):
             print(f"❌ Failed to convert {file['name']}")
+            continue
+        
+        # Upload JPEG to Google Drive
+        media = MediaIoBaseUpload(jpeg_data, mimetype='image/jpeg')
+        jpeg_name = file['name'].replace('.HEIC', '.jpg')
+        
+        new_file = service.files().create(
+            body={'name': jpeg_name, 'parents': [folder_id]},
+            media_body=media
+        ).execute()
         
-        # Clean up temp files
-        if os.path.exists(heic_filename):
-            os.remove(heic_filename)
-        if os.path.exists(jpeg_filename):
-            os.remove(jpeg_filename)
+        print(f"✅ Uploaded {jpeg_name} to Google Drive")
     
     print("Conversion complete!")
 
@@ -7,7 +7,7 @@ from googleapiclient.http import MediaIoBaseDownload
 from PIL import Image
 import pytesseract
 import io
-import re
+from patterns import EMAIL_RE
 
 load_dotenv()
 
@@ -23,8 +23,6 @@ def test_ocr():
     results = service.files().list(q=q, fields="files(id, name)", pageSize=3).execute()
     files = results.get('files', [])
     
-    EMAIL_RE = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}", re.I)
-    
     for file in files:
         print(f"\n{'='*50}")
         print(f"Processing: {file['name']}")
@@ -1,11 +1,14 @@
 #!/usr/bin/env python3
 import os
 import io
-import subprocess
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseDownload
 from dotenv import load_dotenv
+from PIL import Image
+from pillow_heif import register_heif_opener
+
+register_heif_opener()
 
 load_dotenv()
 
@@ -38,24 +41,17 @@ def download_and_convert_heic():
         while not done:
             status, done = downloader.next_chunk()
         
-        # Save HEIC temporarily
-        heic_filename = f"/tmp/{file['name']}"
         jpeg_filename = f"{output_dir}/{file['name'].replace('.HEIC', '.jpg')}"
         
-        with open(heic_filename, 'wb') as f:
-            f.write(heic_data.getvalue())
-        
-        # Convert using ImageMagick (use magick instead of convert)
+        # Decode the HEIC in memory and write the JPEG straight out
         try:
-            subprocess.run(['magick', heic_filename, jpeg_filename], check=True)
+            heic_data.seek(0)
+            image = Image.open(heic_data)
+            image.convert("RGB").save(jpeg_filename, "JPEG", quality=90)
             print(f"✅ Converted {file['name']} to {jpeg_filename}")
                 
-        except subprocess.CalledProcessError:
+        except (OSError, ValueError):
             print(f"❌ Failed to convert {file['name']}")
-        
-        # Clean up temp HEIC file
-        if os.path.exists(heic_filename):
-            os.remove(heic_filename)
     
     print(f"\nConversion complete! All JPEG files are in the '{output_dir}' folder.")
     print("Now manually upload these JPEG files to your Google Drive Business Cards folder.")
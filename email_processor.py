@@ -4,18 +4,37 @@ Email Business Card Processor
 Monitors an email inbox for business card photos and processes them automatically
 """
 import os
-import imaplib
+import json
 import email
-from email.header import decode_header
+import base64
+import quopri
+from email.header import decode_header, make_header
+from email.utils import collapse_rfc2231_value, decode_params, unquote
 import time
-import re
+import sqlite3
 import hashlib
+from collections import OrderedDict
+from functools import lru_cache
 from typing import Dict, Optional, List, Tuple
 from dotenv import load_dotenv
+from imapclient import IMAPClient, SEEN
+from imapclient.response_types import BodyData
 import requests
-from PIL import Image, ImageEnhance
-import pytesseract
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import cv2
+import numpy as np
+from PIL import Image
 import io
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from patterns import EMAIL_RE, PHONE_RE, WEB_RE, CONTACT_RE
+
+# Tesseract reads this when it loads; keep it from spawning a thread per core
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+from tesserocr import PyTessBaseAPI, PSM, OEM, get_languages
 
 load_dotenv()
 
@@ -24,65 +43,175 @@ EMAIL_ADDRESS = os.getenv("EMAIL_ADDRESS")
 EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
 IMAP_SERVER = os.getenv("IMAP_SERVER", "imap.gmail.com")
 IMAP_PORT = int(os.getenv("IMAP_PORT", "993"))
+# Servers drop IDLE after 30 minutes, so re-issue it (with a NOOP) before then
+IDLE_TIMEOUT = 25 * 60
 
 # Mailchimp settings
 MAILCHIMP_API_KEY = os.getenv("MAILCHIMP_API_KEY")
 MAILCHIMP_SERVER_PREFIX = os.getenv("MAILCHIMP_SERVER_PREFIX")
 MAILCHIMP_LIST_ID = os.getenv("MAILCHIMP_LIST_ID")
 MAILCHIMP_TAG = os.getenv("MAILCHIMP_TAG", "Referral Source")
+# Most members Mailchimp accepts in one batch subscribe call
+MAILCHIMP_BATCH_SIZE = 500
+
+# One keep-alive session for every Mailchimp call instead of a TLS handshake per request
+_MC = requests.Session()
+_MC.auth = ("anystring", MAILCHIMP_API_KEY)
+_MC.mount("https://", HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504], raise_on_status=False)
+))
 
-# Regex patterns
-EMAIL_RE = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}", re.I)
-PHONE_RE = re.compile(r"(?:(?:\+?1[\s\-.])?)?(?:\(?\d{3}\)?|\d{3})[\s\-.]?\d{3}[\s\-.]?\d{4}")
-WEB_RE = re.compile(r"\b(?:https?://)?(?:www\.)?[A-Za-z0-9\-]+(?:\.[A-Za-z]{2,}){1,}(/[^\s]*)?\b")
+# OCR output with fewer words than this is treated as junk
+MIN_CARD_WORDS = 5
+# Phone photos are far bigger than Tesseract needs; shrink the long edge to this
+MAX_OCR_EDGE = 2000
+# Tesseract's orientation confidence below which a card is left as it is; on sparse
+# cards OSD often guesses a rotation it has no real evidence for
+MIN_OSD_CONFIDENCE = 2.0
+# Directory with tessdata_fast's eng.traineddata; when set, cards are read with that model
+# first and only re-read with the default one if the result falls short
+TESSDATA_FAST_DIR = os.getenv("TESSDATA_FAST_DIR")
+
+def _check_fast_model(path: Optional[str]) -> Optional[str]:
+    """Drop a TESSDATA_FAST_DIR without eng.traineddata; every fast-model API would fail to start."""
+    try:
+        if not path or "eng" in get_languages(path)[1]:
+            return path
+    except RuntimeError:
+        pass
+    print(f"No eng.traineddata in TESSDATA_FAST_DIR={path}, using the default model only")
+    return None
+
+TESSDATA_FAST_DIR = _check_fast_model(TESSDATA_FAST_DIR)
 
 # Supported image formats
 SUPPORTED_FORMATS = {'.jpg', '.jpeg', '.png', '.heic', '.gif', '.bmp'}
 
+# Attachments already processed, keyed by a hash of their bytes, so a card forwarded
+# twice isn't OCR'd or sent to Mailchimp again. Recent ones are kept in memory too.
+OCR_CACHE_DB = os.getenv("OCR_CACHE_DB", "ocr_cache.db")
+OCR_CACHE_SIZE = 256
+_ocr_cache: "OrderedDict[str, Tuple[str, Dict]]" = OrderedDict()
+_ocr_in_flight = set()
+_cache_conn = None
+
+# OCR is CPU-bound, so attachments are read in worker processes. They are spawned
+# rather than forked so they don't inherit the open IMAP connection.
+def _new_ocr_pool() -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(max_workers=os.cpu_count(),
+                               mp_context=multiprocessing.get_context("spawn"))
+
+_OCR_POOL = _new_ocr_pool()
+# Mailchimp writes go through one background thread so they overlap the next message's OCR
+_MC_WRITER = ThreadPoolExecutor(max_workers=1)
+
 def log(message):
     """Simple logging function"""
     timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
     print(f"[{timestamp}] {message}")
 
+_tess = threading.local()
+
+def _tess_api(name: str, **kwargs) -> PyTessBaseAPI:
+    """Return this thread's Tesseract API for `name`, loading the model only once."""
+    api = getattr(_tess, name, None)
+    if api is None:
+        api = PyTessBaseAPI(**kwargs)
+        # Raw pixel buffers carry no resolution, and cards fill only part of a photo, so
+        # the card's own size says nothing about it; a fixed 300 reads them best
+        api.SetVariable("user_defined_dpi", "300")
+        setattr(_tess, name, api)
+    return api
+
+def _set_image(api: PyTessBaseAPI, img: np.ndarray):
+    """Hand a grayscale array to Tesseract as raw 8-bit pixels, with no PIL round trip."""
+    h, w = img.shape
+    api.SetImageBytes(np.ascontiguousarray(img).tobytes(), w, h, 1, w)
+
+def _ocr(img: np.ndarray, fast: bool = False) -> str:
+    """OCR one grayscale image on this thread's API, with the tessdata_fast model if asked."""
+    if fast:
+        api = _tess_api("ocr_fast", path=TESSDATA_FAST_DIR, lang="eng", psm=PSM.AUTO, oem=OEM.LSTM_ONLY)
+    else:
+        api = _tess_api("ocr", psm=PSM.AUTO)
+    _set_image(api, img)
+    return api.GetUTF8Text()
+
+def _score_text(text: str) -> Tuple[int, bool]:
+    """Score OCR output, and say whether it already reads like a complete business card."""
+    words = len(text.split())
+    # A handful of tokens is noise, not a card; don't bother running the regexes over it
+    if words < MIN_CARD_WORDS:
+        return words, False
+    emails = EMAIL_RE.findall(text)
+    phones = PHONE_RE.findall(text)
+    return len(emails) * 10 + len(phones) * 5 + words, bool(emails and phones and words >= 20)
+
+def detect_rotation(img: np.ndarray) -> int:
+    """Return the card's orientation in degrees, from Tesseract's orientation detection."""
+    api = _tess_api("osd", psm=PSM.OSD_ONLY)
+    _set_image(api, img)
+    osd = api.DetectOrientationScript()
+    # OSD needs a minimum amount of text, and a low-confidence guess does more harm than
+    # good; assume the card is upright
+    if not osd or osd["orient_conf"] < MIN_OSD_CONFIDENCE:
+        return 0
+    return osd["orient_deg"]
+
 def ocr_image_with_rotation(image_data: bytes) -> str:
     """Process image with multiple rotations to find best OCR result."""
+    # Only an undecodable image counts as "no text"; Tesseract errors propagate so the
+    # caller doesn't cache the card as unreadable
     try:
         original_image = Image.open(io.BytesIO(image_data))
+        if original_image.format == "JPEG":
+            # libjpeg can decode straight to grayscale at a reduced scale, skipping most of the IDCT work
+            scale = min(1.0, MAX_OCR_EDGE / max(original_image.size))
+            original_image.draft("L", tuple(int(d * scale) for d in original_image.size))
+        # Bilinear is plenty for OCR and much cheaper than Lanczos
+        original_image.thumbnail((MAX_OCR_EDGE, MAX_OCR_EDGE), Image.Resampling.BILINEAR)
         
+        # Grayscale cards are used as-is and RGB goes through OpenCV's SIMD conversion;
+        # anything else (palette, RGBA, CMYK...) converts to L in one step
         if original_image.mode not in ("RGB", "L"):
-            original_image = original_image.convert("RGB")
-        
-        gray_image = original_image.convert('L')
-        
-        variations = [
-            ("Original", gray_image),
-            ("High Contrast", ImageEnhance.Contrast(gray_image).enhance(2.0)),
-            ("Rotated 90°", gray_image.rotate(90, expand=True)),
-            ("Rotated 180°", gray_image.rotate(180, expand=True)),
-            ("Rotated 270°", gray_image.rotate(270, expand=True)),
-        ]
-        
-        best_result = ""
-        best_score = 0
-        
-        for name, img in variations:
-            try:
-                text = pytesseract.image_to_string(img, config="--psm 3")
-                emails = EMAIL_RE.findall(text)
-                phones = PHONE_RE.findall(text)
-                score = len(emails) * 10 + len(phones) * 5 + len(text.split())
-                
-                if score > best_score:
-                    best_score = score
-                    best_result = text
-                    log(f"  Better OCR from {name} (score: {score})")
-            except Exception:
-                continue
-        
-        return best_result
-    except Exception as e:
-        log(f"  OCR failed: {e}")
+            original_image = original_image.convert("L")
+        arr = np.asarray(original_image)
+        gray_image = arr if original_image.mode == "L" else cv2.cvtColor(arr, cv2.COLOR_RGB2GRAY)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        log(f"  Could not decode image: {e}")
         return ""
+    
+    # One orientation probe instead of OCR'ing every rotation
+    rotation = detect_rotation(gray_image)
+    if rotation:
+        log(f"  Card is rotated {rotation}°, straightening")
+        # np.rot90 turns counter-clockwise and is only a view; copy it once, contiguous
+        gray_image = np.ascontiguousarray(np.rot90(gray_image, rotation // 90))
+    
+    # Binarize locally so uneven lighting doesn't wash out parts of the card
+    binary = cv2.adaptiveThreshold(gray_image, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                   cv2.THRESH_BINARY, 31, 10)
+    # Cheapest first: the fast model (if installed) and then the default one on the
+    # binarized card, then the plain grayscale for light-on-dark cards that binarize badly
+    attempts = [("fast model", binary, True)] if TESSDATA_FAST_DIR else []
+    attempts += [("binarized", binary, False), ("grayscale", gray_image, False)]
+    
+    best_result = ""
+    best_score = -1
+    for name, img, fast in attempts:
+        text = _ocr(img, fast)
+        score, confident = _score_text(text)
+        if score > best_score:
+            if best_result:
+                log(f"  Better OCR from {name} (score: {score})")
+            best_score = score
+            best_result = text
+        if confident:
+            break
+    
+    return best_result
 
 def parse_contact_info(text: str) -> Dict[str, Optional[str]]:
     """Extract contact information from OCR text."""
@@ -93,10 +222,14 @@ def parse_contact_info(text: str) -> Dict[str, Optional[str]]:
     phone = PHONE_RE.search(block)
     web = WEB_RE.search(block)
     
+    # Lines among the first six holding an email, phone or website, from one scan of the block
+    head_end = sum(len(l) + 1 for l in lines[:6])
+    contact_lines = {block.count("\n", 0, m.start()) for m in CONTACT_RE.finditer(block, 0, head_end)}
+    
     name = company = None
     candidates = []
-    for ln in lines[:6]:
-        if EMAIL_RE.search(ln) or PHONE_RE.search(ln) or WEB_RE.search(ln):
+    for idx, ln in enumerate(lines[:6]):
+        if idx in contact_lines:
             continue
         if len(ln.split()) <= 1:
             continue
@@ -115,19 +248,15 @@ def parse_contact_info(text: str) -> Dict[str, Optional[str]]:
         "website": web.group(0) if web else None,
     }
 
-def add_to_mailchimp(email_addr: str, fname: str, lname: str, company: str, phone: str, website: str) -> Tuple[bool, str]:
-    """Add contact to Mailchimp list."""
-    if not email_addr:
-        return False, "No email address found"
-    
-    mhash = hashlib.md5(email_addr.lower().encode()).hexdigest()
-    base = f"https://{MAILCHIMP_SERVER_PREFIX}.api.mailchimp.com/3.0"
-    url = f"{base}/lists/{MAILCHIMP_LIST_ID}/members/{mhash}"
-    auth = ("anystring", MAILCHIMP_API_KEY)
-    
-    payload = {
-        "email_address": email_addr.lower(),
-        "status_if_new": "subscribed",
+@lru_cache(maxsize=4096)
+def _sub_hash(email_lower: str) -> str:
+    """Mailchimp subscriber hash: MD5 of the lowercased email."""
+    return hashlib.md5(email_lower.encode()).hexdigest()
+
+def build_member_payload(email_lower: str, fname: str, lname: str, company: str, phone: str, website: str) -> Dict:
+    """Build the Mailchimp member record for one contact."""
+    return {
+        "email_address": email_lower,
         "status": "subscribed",
         "merge_fields": {
             "FNAME": fname or "",
@@ -137,33 +266,155 @@ def add_to_mailchimp(email_addr: str, fname: str, lname: str, company: str, phon
             "WEBSITE": website or "",
         }
     }
+
+def flush_batch(payloads: List[Dict]) -> Tuple[List[str], List[Dict]]:
+    """Upsert members with the batch subscribe endpoint; return the accepted emails and per-record errors.
+    
+    Records of a request Mailchimp refused outright carry its status_code in their error."""
+    base = f"https://{MAILCHIMP_SERVER_PREFIX}.api.mailchimp.com/3.0"
+    added, errors = [], []
     
-    r = requests.put(url, auth=auth, json=payload, timeout=30)
-    ok = r.status_code in (200, 201)
+    for i in range(0, len(payloads), MAILCHIMP_BATCH_SIZE):
+        chunk = payloads[i:i + MAILCHIMP_BATCH_SIZE]
+        r = _MC.post(f"{base}/lists/{MAILCHIMP_LIST_ID}",
+                     json={"members": chunk, "update_existing": True}, timeout=30)
+        if r.status_code != 200:
+            errors += [{"email_address": p["email_address"], "error": r.text, "status_code": r.status_code}
+                       for p in chunk]
+            continue
+        body = r.json()
+        added += [m["email_address"] for m in body.get("new_members", []) + body.get("updated_members", [])]
+        errors += body.get("errors", [])
     
-    if ok and MAILCHIMP_TAG:
+    if added and MAILCHIMP_TAG:
+        tag_body = json.dumps({"tags": [{"name": MAILCHIMP_TAG, "status": "active"}]})
+        operations = [{
+            "method": "POST",
+            "path": f"/lists/{MAILCHIMP_LIST_ID}/members/{_sub_hash(addr.lower())}/tags",
+            "body": tag_body,
+        } for addr in added]
+        # Tagging is best effort: queue it as one batch operation and don't wait for it
         try:
-            requests.post(
-                f"{base}/lists/{MAILCHIMP_LIST_ID}/members/{mhash}/tags",
-                auth=auth,
-                json={"tags": [{"name": MAILCHIMP_TAG, "status": "active"}]},
-                timeout=20
-            )
-        except Exception:
+            _MC.post(f"{base}/batches", json={"operations": operations}, timeout=20)
+        except requests.RequestException:
             pass
     
-    message = f"Successfully added {email_addr}" if ok else f"Failed to add {email_addr}"
-    return ok, message
+    return added, errors
+
+def _cache_db() -> sqlite3.Connection:
+    """Open the attachment cache database on first use (OCR workers never touch it)."""
+    global _cache_conn
+    if _cache_conn is None:
+        _cache_conn = sqlite3.connect(OCR_CACHE_DB)
+        _cache_conn.execute("CREATE TABLE IF NOT EXISTS ocr_cache (hash TEXT PRIMARY KEY, text TEXT, contact TEXT)")
+    return _cache_conn
+
+def _cache_put(key: str, result: Tuple[str, Dict]):
+    _ocr_cache[key] = result
+    _ocr_cache.move_to_end(key)
+    if len(_ocr_cache) > OCR_CACHE_SIZE:
+        _ocr_cache.popitem(last=False)
 
-def process_email_message(mail, email_id):
-    """Process a single email message."""
+def cached_result(key: str) -> Optional[Tuple[str, Dict]]:
+    """Return the stored result for an attachment processed before, if any."""
+    if key in _ocr_cache:
+        _ocr_cache.move_to_end(key)
+        return _ocr_cache[key]
+    row = _cache_db().execute("SELECT text, contact FROM ocr_cache WHERE hash = ?", (key,)).fetchone()
+    if row is None:
+        return None
+    result = row[0], json.loads(row[1])
+    _cache_put(key, result)
+    return result
+
+def remember_result(key: str, text: str, contact: Dict):
+    """Record an attachment as processed, in memory and in the cache database."""
+    _cache_put(key, (text, contact))
+    with _cache_db() as conn:
+        conn.execute("INSERT OR REPLACE INTO ocr_cache VALUES (?, ?, ?)", (key, text, json.dumps(contact)))
+
+def ocr_and_parse(image_data: bytes) -> Tuple[str, Dict[str, Optional[str]]]:
+    """OCR one attachment and parse the contact from it; runs in an OCR worker process."""
+    text = ocr_image_with_rotation(image_data)
+    return text, parse_contact_info(text) if text.strip() else {}
+
+def _decode_mime(value: str) -> str:
+    """Decode a (possibly RFC 2047 encoded) header or parameter value."""
+    return str(make_header(decode_header(value)))
+
+def _params(values) -> Dict[str, str]:
+    """Turn a BODYSTRUCTURE parameter list (key, value, key, value, ...) into a dict,
+    joining RFC 2231 continuations and charset-tagged values (filename*=utf-8''...)."""
+    values = values or ()
+    pairs = [(k.decode("ascii", "replace").lower(), (v or b"").decode("utf-8", "replace"))
+             for k, v in zip(values[::2], values[1::2])]
+    # decode_params passes the first pair (normally the content type) through untouched
+    return {k: unquote(collapse_rfc2231_value(v)) for k, v in decode_params([("", "")] + pairs)[1:]}
+
+def _part_filename(part) -> Optional[str]:
+    """Filename of a BODYSTRUCTURE leaf, from its Content-Disposition or its name parameter."""
+    # The disposition sits in the extension data as (type, params)
+    for ext in part[7:]:
+        if isinstance(ext, tuple) and len(ext) == 2 and isinstance(ext[1], tuple):
+            name = _params(ext[1]).get("filename")
+            if name:
+                return _decode_mime(name)
+    name = _params(part[2]).get("name")
+    return _decode_mime(name) if name else None
+
+def _attachment_parts(structure, section: str = "") -> List[Tuple[str, str, bytes]]:
+    """Walk a BODYSTRUCTURE and return (section, filename, encoding) for each named leaf part."""
+    if structure.is_multipart:
+        parts = []
+        for i, child in enumerate(structure[0], 1):
+            parts += _attachment_parts(child, f"{section}.{i}" if section else str(i))
+        return parts
+    if (structure[0] or b"").lower() == b"message" and (structure[1] or b"").lower() == b"rfc822":
+        # A forwarded message: its own body is at [8] (left unparsed by imapclient) and
+        # its sections are numbered under this one
+        body = BodyData.create(structure[8])
+        return _attachment_parts(body, section if body.is_multipart else f"{section or '1'}.1")
+    filename = _part_filename(structure)
+    return [(section or "1", filename, (structure[5] or b"").upper())] if filename else []
+
+def _decode_part(data: bytes, encoding: bytes) -> bytes:
+    """Undo the transfer encoding of a fetched body part."""
+    if encoding == b"BASE64":
+        return base64.b64decode(data)
+    if encoding == b"QUOTED-PRINTABLE":
+        return quopri.decodestring(data)
+    return data
+
+def _restart_ocr_pool():
+    """Replace the OCR pool; once a worker dies (OOM kill, Tesseract crash) it never recovers."""
+    global _OCR_POOL
+    log("  ♻️  OCR worker died, restarting the pool")
+    _OCR_POOL.shutdown(wait=False)
+    _OCR_POOL = _new_ocr_pool()
+
+def _submit_ocr(image_data: bytes) -> Future:
+    try:
+        return _OCR_POOL.submit(ocr_and_parse, image_data)
+    except BrokenProcessPool:
+        _restart_ocr_pool()
+        return _OCR_POOL.submit(ocr_and_parse, image_data)
+
+def submit_email_message(client: IMAPClient, msg_id: int) -> Tuple[List[Tuple[str, str, Future]], bool]:
+    """Fetch one message's image attachments and queue OCR for those not seen before.
+    
+    Also returns whether every attachment was queued, so a failed message isn't marked read."""
+    jobs = []
     try:
-        status, msg_data = mail.fetch(email_id, "(RFC822)")
+        # Look at the structure first and download only the image parts. PEEK leaves
+        # \Seen alone until the message is marked once it has been handled.
+        msg_data = client.fetch([msg_id], ["BODYSTRUCTURE", "BODY.PEEK[HEADER.FIELDS (FROM SUBJECT)]"]).get(msg_id)
         
-        if status != "OK":
-            return
+        if not msg_data:
+            return jobs, False
         
-        msg = email.message_from_bytes(msg_data[0][1])
+        # Servers differ in how they echo the field list back, so match on the prefix
+        headers = next((v for k, v in msg_data.items() if k.startswith(b"BODY[HEADER")), b"")
+        msg = email.message_from_bytes(headers)
         
         from_header = msg.get("From")
         sender = email.utils.parseaddr(from_header)[1]
@@ -177,70 +428,152 @@ def process_email_message(mail, email_id):
         log(f"\n📧 Processing email from {sender}")
         log(f"  Subject: {subject}")
         
-        attachments_found = 0
-        contacts_added = 0
+        attachments = [(section, filename, encoding)
+                       for section, filename, encoding in _attachment_parts(msg_data[b"BODYSTRUCTURE"])
+                       if os.path.splitext(filename)[1].lower() in SUPPORTED_FORMATS]
+        if not attachments:
+            log(f"  ℹ️  No image attachments found")
+            return jobs, True
         
-        for part in msg.walk():
-            if part.get_content_maintype() == 'multipart':
-                continue
-            
-            filename = part.get_filename()
-            if not filename:
-                continue
-            
-            file_ext = os.path.splitext(filename)[1].lower()
-            if file_ext not in SUPPORTED_FORMATS:
-                continue
-            
-            attachments_found += 1
+        bodies = client.fetch([msg_id], [f"BODY.PEEK[{section}]" for section, _, _ in attachments]).get(msg_id, {})
+        
+        for section, filename, encoding in attachments:
             log(f"  📎 Found attachment: {filename}")
             
-            image_data = part.get_payload(decode=True)
-            
-            log(f"  🔍 Processing OCR...")
-            text = ocr_image_with_rotation(image_data)
-            
-            if not text.strip():
-                log(f"  ❌ No text extracted from {filename}")
+            image_data = _decode_part(bodies.get(f"BODY[{section}]".encode()) or b"", encoding)
+            key = hashlib.blake2b(image_data, digest_size=16).hexdigest()
+            if key in _ocr_in_flight:
+                log(f"  ♻️  {filename} is already being processed, skipping")
                 continue
-            
-            contact = parse_contact_info(text)
-            log(f"  📋 Extracted: {contact.get('name')} - {contact.get('email')}")
-            
-            if not contact['email']:
-                log(f"  ⚠️  No email found in {filename}")
+            cached = cached_result(key)
+            if cached:
+                log(f"  ♻️  {filename} was already processed ({cached[1].get('email') or 'no email'}), skipping")
                 continue
             
-            fname = lname = ""
-            if contact['name']:
-                parts = contact['name'].split()
-                if len(parts) >= 2:
-                    fname, lname = parts[0], " ".join(parts[1:])
-                else:
-                    fname = parts[0]
-            
-            success, message = add_to_mailchimp(
-                contact['email'],
-                fname,
-                lname,
-                contact['company'],
-                contact['phone'],
-                contact['website']
-            )
-            
-            if success:
-                contacts_added += 1
-                log(f"  ✅ {message}")
-            else:
-                log(f"  ❌ {message}")
-        
-        if attachments_found == 0:
-            log(f"  ℹ️  No image attachments found")
-        else:
-            log(f"  📊 Processed {attachments_found} images, added {contacts_added} contacts")
+            _ocr_in_flight.add(key)
+            jobs.append((filename, key, _submit_ocr(image_data)))
         
     except Exception as e:
         log(f"  ❌ Error processing email: {e}")
+        return jobs, False
+    return jobs, True
+
+def finish_email_message(jobs: List[Tuple[str, str, Future]]) -> Tuple[Optional[Tuple[int, Optional[Future], Dict]], List[Exception]]:
+    """Wait for one message's OCR results and queue its contacts for Mailchimp as one batch.
+    
+    Also returns the errors of any OCR jobs that raised."""
+    ocr_errors = []
+    if not jobs:
+        return None, ocr_errors
+    
+    payloads = {}
+    # Cards with an email are only remembered once Mailchimp has accepted them
+    awaiting = {}
+    for filename, key, fut in jobs:
+        _ocr_in_flight.discard(key)
+        try:
+            text, contact = fut.result()
+        except Exception as e:
+            log(f"  ❌ OCR failed for {filename}: {e!r}")
+            ocr_errors.append(e)
+            continue
+        
+        if not text.strip():
+            log(f"  ❌ No text extracted from {filename}")
+            remember_result(key, text, contact)
+            continue
+        
+        log(f"  📋 Extracted: {contact.get('name')} - {contact.get('email')}")
+        
+        if not contact['email']:
+            log(f"  ⚠️  No email found in {filename}")
+            remember_result(key, text, contact)
+            continue
+        
+        fname = lname = ""
+        if contact['name']:
+            parts = contact['name'].split()
+            if len(parts) >= 2:
+                fname, lname = parts[0], " ".join(parts[1:])
+            else:
+                fname = parts[0]
+        
+        # A batch can't hold the same address twice; the first card with it wins
+        low = contact['email'].lower()
+        awaiting.setdefault(low, []).append((key, text, contact))
+        payloads.setdefault(low, build_member_payload(
+            low,
+            fname,
+            lname,
+            contact['company'],
+            contact['phone'],
+            contact['website']
+        ))
+    
+    write = _MC_WRITER.submit(flush_batch, list(payloads.values())) if payloads else None
+    return (len(jobs), write, awaiting), ocr_errors
+
+def report_email_message(finished: Optional[Tuple[int, Optional[Future], Dict]]) -> bool:
+    """Wait for a message's Mailchimp batch, log the outcome and remember the cards it added.
+    
+    Returns False when the batch didn't reach Mailchimp, so the message can be retried;
+    records Mailchimp itself rejected would only be rejected again."""
+    if not finished:
+        return True
+    
+    images, write, awaiting = finished
+    added = []
+    delivered = True
+    if write:
+        try:
+            added, errors = write.result()
+            delivered = not any("status_code" in err for err in errors)
+        except requests.RequestException as e:
+            errors = [{"email_address": addr, "error": str(e)} for addr in awaiting]
+            delivered = False
+        
+        for addr in added:
+            log(f"  ✅ Successfully added {addr}")
+            for key, text, contact in awaiting.get(addr.lower(), []):
+                remember_result(key, text, contact)
+        for err in errors:
+            log(f"  ❌ Failed to add {err.get('email_address')}: {err.get('error')}")
+    
+    log(f"  📊 Processed {images} images, added {len(added)} contacts")
+    return delivered
+
+def process_unseen(client: IMAPClient):
+    """Process every unread message in the selected folder and mark it read.
+    
+    Searches again after each round until nothing new is unread: the server reports mail
+    that arrives meanwhile during these commands, so a following IDLE would never hear of
+    it. Messages left unread to retry are only picked up again by the next call."""
+    retry = set()
+    email_ids = client.search("UNSEEN")
+    
+    while email_ids:
+        log(f"\n📬 Found {len(email_ids)} new email(s)")
+        
+        # Queue every message's attachments before waiting on any, so all the cards
+        # are OCR'd in parallel. Each message's Mailchimp batch is sent in the background
+        # while the next one's OCR results are collected.
+        pending = [(email_id, submit_email_message(client, email_id)) for email_id in email_ids]
+        finished = [(email_id, queued, finish_email_message(jobs)) for email_id, (jobs, queued) in pending]
+        pool_broken = False
+        for email_id, queued, (result, ocr_errors) in finished:
+            delivered = report_email_message(result)
+            pool_broken |= any(isinstance(e, BrokenProcessPool) for e in ocr_errors)
+            if not queued or ocr_errors or not delivered:
+                # Leave it unread so it is retried; cards that did finish are cached and skipped then
+                log(f"  ⏳ Leaving message {email_id} unread to retry")
+                retry.add(email_id)
+                continue
+            client.add_flags([email_id], [SEEN])
+        
+        if pool_broken:
+            _restart_ocr_pool()
+        
+        email_ids = [email_id for email_id in client.search("UNSEEN") if email_id not in retry]
 
 def monitor_inbox():
     """Monitor email inbox for new messages."""
@@ -251,30 +584,35 @@ def monitor_inbox():
     
     while True:
         try:
-            mail = imaplib.IMAP4_SSL(IMAP_SERVER, IMAP_PORT)
-            mail.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-            mail.select("INBOX")
-            
-            status, messages = mail.search(None, "UNSEEN")
+            # One connection for the life of the process; IDLE lets the server tell us about new mail
+            client = IMAPClient(IMAP_SERVER, port=IMAP_PORT, ssl=True)
+            client.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
+            client.select_folder("INBOX")
+            can_idle = client.has_capability("IDLE")
             
-            if status == "OK":
-                email_ids = messages[0].split()
-                
-                if email_ids:
-                    log(f"\n📬 Found {len(email_ids)} new email(s)")
+            try:
+                while True:
+                    process_unseen(client)
                     
-                    for email_id in email_ids:
-                        process_email_message(mail, email_id)
-                        mail.store(email_id, '+FLAGS', '\\Seen')
-            
-            mail.close()
-            mail.logout()
-            
-            time.sleep(30)
+                    if not can_idle:
+                        time.sleep(30)
+                        continue
+                    
+                    # Block until the server pushes a change; on a quiet timeout, NOOP keeps the session alive
+                    client.idle()
+                    responses = client.idle_check(timeout=IDLE_TIMEOUT)
+                    client.idle_done()
+                    if not responses:
+                        client.noop()
+            finally:
+                try:
+                    client.logout()
+                except Exception:
+                    pass
             
         except Exception as e:
             log(f"❌ Connection error: {e}")
-            log("⏳ Retrying in 60 seconds...")
+            log("⏳ Reconnecting in 60 seconds...")
             time.sleep(60)
 
 if __name__ == "__main__":
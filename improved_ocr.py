@@ -3,11 +3,10 @@ import os
 from dotenv import load_dotenv
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
 from PIL import Image, ImageEnhance, ImageFilter
 import pytesseract
 import io
-import re
+from patterns import EMAIL_RE, PHONE_RE
 import numpy as np
 
 load_dotenv()
@@ -56,25 +55,17 @@ def test_improved_ocr():
     results = service.files().list(q=q, fields="files(id, name)", pageSize=1).execute()
     files = results.get('files', [])
     
-    EMAIL_RE = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}", re.I)
-    PHONE_RE = re.compile(r"(?:(?:\+?1[\s\-.])?)?(?:\(?\d{3}\)?|\d{3})[\s\-.]?\d{3}[\s\-.]?\d{4}")
-    
     for file in files:
         print(f"\n{'='*50}")
         print(f"Processing: {file['name']}")
         print('='*50)
         
-        # Download
-        req = service.files().get_media(fileId=file['id'])
-        buf = io.BytesIO()
-        downloader = MediaIoBaseDownload(buf, req)
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
+        # Download in one request; a card photo is far below MediaIoBaseDownload's
+        # 100 MB chunk anyway, so chunking only adds its bookkeeping
+        buf = io.BytesIO(service.files().get_media(fileId=file['id']).execute())
         
         # Load image
-        data = buf.getvalue()
-        original_image = Image.open(io.BytesIO(data))
+        original_image = Image.open(buf)
         
         # Try different preprocessing
         processed_images = preprocess_image(original_image)
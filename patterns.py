@@ -0,0 +1,19 @@
+"""
+Regex patterns for pulling contact details out of OCR text,
+compiled once and shared by every scanner entry point
+"""
+import re
+
+EMAIL_RE = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}", re.I)
+# Area code is either fully parenthesised or bare, so there is nothing to backtrack over;
+# a bare one may keep its closing paren, since OCR often drops just the opening one
+PHONE_RE = re.compile(r"(?:\+?1[\s.\-]?)?(?:\(\d{3}\)|\d{3}\)?)[\s.\-]?\d{3}[\s.\-]?\d{4}")
+# Same, but the area code may be missing too (local 7-digit numbers), as app.py accepts
+APP_PHONE_RE = re.compile(r"(?:(?:\+?1[\s.\-]?)?(?:\(\d{3}\)|\d{3}\)?)[\s.\-]?)?\d{3}[\s.\-]?\d{4}")
+WEB_RE = re.compile(r"\b(?:https?://)?(?:www\.)?[A-Za-z0-9\-]+(?:\.[A-Za-z]{2,}){1,}(/[^\s]*)?\b", re.I)
+
+# Any of the above, for a single "does this line hold contact details" check. Phone
+# separators can't be line breaks here (e-mail and web patterns never span whitespace),
+# so a scan over lines joined with "\n" never runs a match from one line into the next
+_LINE_PHONE = PHONE_RE.pattern.replace(r"[\s.\-]", r"(?:[^\S\n]|[.\-])")
+CONTACT_RE = re.compile("|".join((EMAIL_RE.pattern, _LINE_PHONE, WEB_RE.pattern)), re.I)
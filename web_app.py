@@ -2,75 +2,182 @@
 from flask import Flask, render_template, request, jsonify
 import os
 import io
-import re
 import hashlib
+from functools import lru_cache
 from typing import Dict, Optional
 from dotenv import load_dotenv
 import requests
-from PIL import Image, ImageEnhance
-import pytesseract
-from werkzeug.utils import secure_filename
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import cv2
+import numpy as np
+from PIL import Image
 import secrets
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from patterns import EMAIL_RE, PHONE_RE, WEB_RE, CONTACT_RE
+
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+from tesserocr import PyTessBaseAPI, PSM, OEM, get_languages
 
 load_dotenv()
 
 app = Flask(__name__)
-app.config['SECRET_KEY'] = secrets.token_hex(16)
-app.config['UPLOAD_FOLDER'] = 'uploads'
+app.config['SECRET_KEY'] = os.getenv('SECRET_KEY') or secrets.token_hex(16)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 app.config['ALLOWED_EXTENSIONS'] = {'jpg', 'jpeg', 'png', 'heic'}
 
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-
 MAILCHIMP_API_KEY = os.getenv("MAILCHIMP_API_KEY")
 MAILCHIMP_SERVER_PREFIX = os.getenv("MAILCHIMP_SERVER_PREFIX")
 MAILCHIMP_LIST_ID = os.getenv("MAILCHIMP_LIST_ID")
 MAILCHIMP_TAG = os.getenv("MAILCHIMP_TAG", "Referral Source")
 
-EMAIL_RE = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}", re.I)
-PHONE_RE = re.compile(r"(?:(?:\+?1[\s\-.])?)?(?:\(?\d{3}\)?|\d{3})[\s\-.]?\d{3}[\s\-.]?\d{4}")
-WEB_RE = re.compile(r"\b(?:https?://)?(?:www\.)?[A-Za-z0-9\-]+(?:\.[A-Za-z]{2,}){1,}(/[^\s]*)?\b")
+# One keep-alive session for every Mailchimp call instead of a TLS handshake per request
+_MC = requests.Session()
+_MC.auth = ("anystring", MAILCHIMP_API_KEY)
+_MC.mount("https://", HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504], raise_on_status=False)
+))
+
+# OCR output with fewer words than this is treated as junk
+MIN_CARD_WORDS = 5
+# Phone photos are far bigger than Tesseract needs; shrink the long edge to this
+MAX_OCR_EDGE = 2000
+# Tesseract's orientation confidence below which a card is left as it is; on sparse
+# cards OSD often guesses a rotation it has no real evidence for
+MIN_OSD_CONFIDENCE = 2.0
+# Directory with tessdata_fast's eng.traineddata; when set, cards are read with that model
+# first and only re-read with the default one if the result falls short
+TESSDATA_FAST_DIR = os.getenv("TESSDATA_FAST_DIR")
+
+def _check_fast_model(path):
+    # A wrong path would make every fast-model API fail to start; check once and skip it instead
+    try:
+        if not path or "eng" in get_languages(path)[1]:
+            return path
+    except RuntimeError:
+        pass
+    print(f"No eng.traineddata in TESSDATA_FAST_DIR={path}, using the default model only")
+    return None
+
+TESSDATA_FAST_DIR = _check_fast_model(TESSDATA_FAST_DIR)
+
+_tess = threading.local()
+_OCR_POOL = ProcessPoolExecutor(max_workers=os.cpu_count(), mp_context=multiprocessing.get_context("spawn"))
+_OCR_POOL_LOCK = threading.Lock()
+
+def _restart_ocr_pool(broken):
+    # A pool whose worker died (OOM kill, Tesseract crash) rejects every later job; replace it once
+    global _OCR_POOL
+    with _OCR_POOL_LOCK:
+        if _OCR_POOL is broken:
+            broken.shutdown(wait=False)
+            _OCR_POOL = ProcessPoolExecutor(max_workers=os.cpu_count(), mp_context=multiprocessing.get_context("spawn"))
+
+def run_ocr(image_data: bytes) -> str:
+    pool = _OCR_POOL
+    try:
+        return pool.submit(ocr_image_with_rotation, image_data).result()
+    except BrokenProcessPool:
+        _restart_ocr_pool(pool)
+        return _OCR_POOL.submit(ocr_image_with_rotation, image_data).result()
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
-def ocr_image_with_rotation(image_path: str) -> str:
+def _tess_api(name, **kwargs):
+    api = getattr(_tess, name, None)
+    if api is None:
+        api = PyTessBaseAPI(**kwargs)
+        # Raw pixel buffers carry no resolution, and cards fill only part of a photo, so
+        # the card's own size says nothing about it; a fixed 300 reads them best
+        api.SetVariable("user_defined_dpi", "300")
+        setattr(_tess, name, api)
+    return api
+
+def _set_image(api, img):
+    h, w = img.shape
+    api.SetImageBytes(np.ascontiguousarray(img).tobytes(), w, h, 1, w)
+
+def _ocr(img, fast=False):
+    if fast:
+        api = _tess_api("ocr_fast", path=TESSDATA_FAST_DIR, lang="eng", psm=PSM.AUTO, oem=OEM.LSTM_ONLY)
+    else:
+        api = _tess_api("ocr", psm=PSM.AUTO)
+    _set_image(api, img)
+    return api.GetUTF8Text()
+
+def _score_text(text):
+    words = len(text.split())
+    # A handful of tokens is noise, not a card; don't bother running the regexes over it
+    if words < MIN_CARD_WORDS:
+        return words, False
+    emails = EMAIL_RE.findall(text)
+    phones = PHONE_RE.findall(text)
+    return len(emails) * 10 + len(phones) * 5 + words, bool(emails and phones and words >= 20)
+
+def detect_rotation(img):
+    api = _tess_api("osd", psm=PSM.OSD_ONLY)
+    _set_image(api, img)
+    osd = api.DetectOrientationScript()
+    # OSD needs a minimum amount of text, and a low-confidence guess does more harm than
+    # good; assume the card is upright
+    if not osd or osd["orient_conf"] < MIN_OSD_CONFIDENCE:
+        return 0
+    return osd["orient_deg"]
+
+def ocr_image_with_rotation(image_data: bytes) -> str:
+    # Only an undecodable image counts as "no text"; Tesseract errors propagate so the
+    # caller doesn't cache the card as unreadable
     try:
-        original_image = Image.open(image_path)
+        original_image = Image.open(io.BytesIO(image_data))
+        if original_image.format == "JPEG":
+            # libjpeg can decode straight to grayscale at a reduced scale, skipping most of the IDCT work
+            scale = min(1.0, MAX_OCR_EDGE / max(original_image.size))
+            original_image.draft("L", tuple(int(d * scale) for d in original_image.size))
+        # Bilinear is plenty for OCR and much cheaper than Lanczos
+        original_image.thumbnail((MAX_OCR_EDGE, MAX_OCR_EDGE), Image.Resampling.BILINEAR)
         
+        # Grayscale cards are used as-is and RGB goes through OpenCV's SIMD conversion;
+        # anything else (palette, RGBA, CMYK...) converts to L in one step
         if original_image.mode not in ("RGB", "L"):
-            original_image = original_image.convert("RGB")
-        
-        gray_image = original_image.convert('L')
-        
-        variations = [
-            ("Original", gray_image),
-            ("High Contrast", ImageEnhance.Contrast(gray_image).enhance(2.0)),
-            ("Rotated 90°", gray_image.rotate(90, expand=True)),
-            ("Rotated 180°", gray_image.rotate(180, expand=True)),
-            ("Rotated 270°", gray_image.rotate(270, expand=True)),
-        ]
-        
-        best_result = ""
-        best_score = 0
-        
-        for name, img in variations:
-            try:
-                text = pytesseract.image_to_string(img, config="--psm 3")
-                emails = EMAIL_RE.findall(text)
-                phones = PHONE_RE.findall(text)
-                score = len(emails) * 10 + len(phones) * 5 + len(text.split())
-                
-                if score > best_score:
-                    best_score = score
-                    best_result = text
-            except Exception:
-                continue
-        
-        return best_result
-    except Exception as e:
-        print(f"OCR failed: {e}")
+            original_image = original_image.convert("L")
+        arr = np.asarray(original_image)
+        gray_image = arr if original_image.mode == "L" else cv2.cvtColor(arr, cv2.COLOR_RGB2GRAY)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        print(f"Could not decode image: {e}")
         return ""
+    
+    # One orientation probe instead of OCR'ing every rotation
+    rotation = detect_rotation(gray_image)
+    if rotation:
+        # np.rot90 turns counter-clockwise and is only a view; copy it once, contiguous
+        gray_image = np.ascontiguousarray(np.rot90(gray_image, rotation // 90))
+    
+    # Binarize locally so uneven lighting doesn't wash out parts of the card
+    binary = cv2.adaptiveThreshold(gray_image, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                   cv2.THRESH_BINARY, 31, 10)
+    # Cheapest first: the fast model (if installed) and then the default one on the
+    # binarized card, then the plain grayscale for light-on-dark cards that binarize badly
+    attempts = [("fast model", binary, True)] if TESSDATA_FAST_DIR else []
+    attempts += [("binarized", binary, False), ("grayscale", gray_image, False)]
+    
+    best_result = ""
+    best_score = -1
+    for name, img, fast in attempts:
+        text = _ocr(img, fast)
+        score, confident = _score_text(text)
+        if score > best_score:
+            best_score = score
+            best_result = text
+        if confident:
+            break
+    
+    return best_result
 
 def parse_contact_info(text: str) -> Dict[str, Optional[str]]:
     lines = [l.strip() for l in text.splitlines() if l.strip()]
@@ -80,10 +187,14 @@ def parse_contact_info(text: str) -> Dict[str, Optional[str]]:
     phone = PHONE_RE.search(block)
     web = WEB_RE.search(block)
     
+    # Lines among the first six holding an email, phone or website, from one scan of the block
+    head_end = sum(len(l) + 1 for l in lines[:6])
+    contact_lines = {block.count("\n", 0, m.start()) for m in CONTACT_RE.finditer(block, 0, head_end)}
+    
     name = company = None
     candidates = []
-    for ln in lines[:6]:
-        if EMAIL_RE.search(ln) or PHONE_RE.search(ln) or WEB_RE.search(ln):
+    for idx, ln in enumerate(lines[:6]):
+        if idx in contact_lines:
             continue
         if len(ln.split()) <= 1:
             continue
@@ -102,17 +213,21 @@ def parse_contact_info(text: str) -> Dict[str, Optional[str]]:
         "website": web.group(0) if web else None,
     }
 
+@lru_cache(maxsize=4096)
+def _sub_hash(email_lower):
+    return hashlib.md5(email_lower.encode()).hexdigest()
+
 def add_to_mailchimp(email, fname, lname, company, phone, website):
     if not email:
         return False, "No email address found"
     
-    mhash = hashlib.md5(email.lower().encode()).hexdigest()
+    low = email.lower()
+    mhash = _sub_hash(low)
     base = f"https://{MAILCHIMP_SERVER_PREFIX}.api.mailchimp.com/3.0"
     url = f"{base}/lists/{MAILCHIMP_LIST_ID}/members/{mhash}"
-    auth = ("anystring", MAILCHIMP_API_KEY)
     
     payload = {
-        "email_address": email.lower(),
+        "email_address": low,
         "status_if_new": "subscribed",
         "status": "subscribed",
         "merge_fields": {
@@ -124,14 +239,13 @@ def add_to_mailchimp(email, fname, lname, company, phone, website):
         }
     }
     
-    r = requests.put(url, auth=auth, json=payload, timeout=30)
+    r = _MC.put(url, json=payload, timeout=30)
     ok = r.status_code in (200, 201)
     
     if ok and MAILCHIMP_TAG:
         try:
-            requests.post(
+            _MC.post(
                 f"{base}/lists/{MAILCHIMP_LIST_ID}/members/{mhash}/tags",
-                auth=auth,
                 json={"tags": [{"name": MAILCHIMP_TAG, "status": "active"}]},
                 timeout=20
             )
@@ -158,11 +272,7 @@ def upload_file():
         return jsonify({'success': False, 'error': 'Invalid file type. Please upload JPG, PNG, or HEIC'}), 400
     
     try:
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        
-        text = ocr_image_with_rotation(filepath)
+        text = run_ocr(file.read())
         
         if not text.strip():
             return jsonify({
@@ -214,9 +324,6 @@ def upload_file():
             'success': False,
             'error': f"Processing error: {str(e)}"
         }), 500
-    finally:
-        if os.path.exists(filepath):
-            os.remove(filepath)
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    app.run(debug=bool(os.getenv('FLASK_DEV')), threaded=True, host='0.0.0.0', port=5000)